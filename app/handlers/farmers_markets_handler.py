@@ -4,9 +4,13 @@ from models.models import FarmersMarket
 from app.db_control import Session
 from math import radians, sin, cos, sqrt, atan2
 import random   
+import re
 
 class FarmersMarketHandler:
     def __init__(self):
+        # Optional MarketSnapshot, attached by wsgi.py before workers fork
+        self.snapshot = None
+
         self.diverse_groups = {
             'diversegroup_1': 'Native American-Owned Business',
             'diversegroup_2': 'Minority-Owned Business',
@@ -38,7 +42,7 @@ class FarmersMarketHandler:
             'acceptedpayment_2': 'Volunteer Work',
             'acceptedpayment_3': 'Cash',
             'acceptedpayment_4': 'Personal Checks',
-            'acceptedpayment_5': 'Commerical Checks/Accounts',
+            'acceptedpayment_5': 'Commercial Checks/Accounts',
             'acceptedpayment_6': 'Debit card/Credit card'
         }
 
@@ -51,10 +55,8 @@ class FarmersMarketHandler:
             'FNAP_888': 'Other Food and Nutrition Assistance Programs'
         }
 
-    def get_filters(self):
-        city_states = self.get_unique_city_states()
-
-        filters = {
+        # Options offered by get_filters, apart from the cities which come from the table
+        self.filter_params = {
             'diversity': [
                 {'param_key': f'diversegroup_{i}', 'param_value': group}
                 for i, group in enumerate(['Native American-Owned Business', 'Minority-Owned Business', 'Women-Owned Business', 'Veteran-Owned Business', 'LGBTQIA+ Owned Business', 'Disability-Owned Business'], start=1)
@@ -70,7 +72,82 @@ class FarmersMarketHandler:
             'fnap': [
                 {'param_key': f'FNAP_{i}', 'param_value': fnap}
                 for i, fnap in enumerate(['WIC', 'SNAP', 'Market Bucks', 'Senior Farmers Market Nutrition Program Market Bucks', 'Accept EBT at a central location', 'PoP'], start=1)
-            ],
+            ]
+        }
+
+        # Slug text for each filter value, used by parse_slug_to_filters
+        self.diversity_mapping = {
+            'native-american-owned-business': 'diversegroup_1',
+            'minority-owned-business': 'diversegroup_2',
+            'women-owned-business': 'diversegroup_3',
+            'veteran-owned-business': 'diversegroup_4',
+            'lgbtqia+-owned-business': 'diversegroup_5',
+            'disability-owned-business': 'diversegroup_6'
+        }
+
+        self.production_mapping = {
+            'organic-usda-certified': 'specialproductionmethods_1',
+            'non-certified-but-practicing-organic': 'specialproductionmethods_2',
+            'naturally-grown': 'specialproductionmethods_3',
+            'gap-certified': 'specialproductionmethods_4',
+            'no-antibiotics': 'specialproductionmethods_5',
+            'non-gmo': 'specialproductionmethods_6',
+            'no-hormones': 'specialproductionmethods_7',
+            'no-pesticides': 'specialproductionmethods_8',
+            'grass-fed': 'specialproductionmethods_9',
+            'pasture-raised-free-range-animals': 'specialproductionmethods_10',
+            'humane-treatment-of-animals': 'specialproductionmethods_11',
+            'fair-labor-practices-living-wage-fair-trade': 'specialproductionmethods_12',
+            'kosher': 'specialproductionmethods_13',
+            'halal': 'specialproductionmethods_14'
+        }
+
+        self.payment_mapping = {
+            'barter': 'acceptedpayment_1',
+            'volunteer-work': 'acceptedpayment_2',
+            'cash': 'acceptedpayment_3',
+            'personal-checks': 'acceptedpayment_4',
+            'commercial-checks-accounts': 'acceptedpayment_5',
+            'debit-card-credit-card': 'acceptedpayment_6',
+        }
+
+        self.fnap_mapping = {
+            'wic': 'FNAP_1',
+            'snap': 'FNAP_2',
+            'market-bucks': 'FNAP_3',
+            'wic-farmers-market': 'FNAP_4',
+            'senior-farmers-market-nutrition-program': 'FNAP_5',
+            'other-food-nutrition-assistance-programs': 'FNAP_888'
+        }
+
+        # Reverse lookup used by generate_slug_from_filters, so both directions use the same text
+        self.filter_slugs = {
+            key: slug
+            for mapping in (self.diversity_mapping, self.production_mapping, self.payment_mapping, self.fnap_mapping)
+            for slug, key in mapping.items()
+        }
+
+        # Layout of the slugs generate_slug_from_filters builds
+        self.slug_pattern = re.compile(
+            rf"(?:(?P<diversity>{self.slug_alternatives(self.diversity_mapping)})-)?farmers-markets(?:-that)?"
+            rf"(?:-have-(?P<production>{self.slug_alternatives(self.production_mapping)})-products)?"
+            rf"(?:-accept-(?P<payments>{self.slug_alternatives(self.payment_mapping)}))?"
+            rf"(?:-accept-(?P<fnap>{self.slug_alternatives(self.fnap_mapping)}))?"
+            r"(?:-are-in-(?P<city_state>.+))?"
+        )
+
+    def current_snapshot(self):
+        # Refresh the attached snapshot if the table changed; None when running without one
+        if self.snapshot is not None:
+            self.snapshot = self.snapshot.refreshed()
+        return self.snapshot
+
+    def get_filters(self):
+        snapshot = self.current_snapshot()
+        city_states = snapshot.city_states if snapshot is not None else self.get_unique_city_states()
+
+        filters = {
+            **self.filter_params,
             'city_state': [
                 {'param_key': city_state, 'param_value': city_state}
                 for city_state in city_states
@@ -137,10 +214,12 @@ class FarmersMarketHandler:
 
             if 'city_state' in filters:
                 # Convert the input city_state to lowercase and remove commas, etc.
-                city_state_input = filters['city_state'].replace(',', '').lower()
+                # Hyphens become spaces, as they do when a city goes through a slug
+                city_state_input = filters['city_state'].replace(',', '').replace('-', ' ').lower()
                 
-                # Query the database, converting location_address to lowercase and removing commas, etc.
-                query = query.filter(func.replace(func.lower(FarmersMarket.location_address), ',', '').like(f"%{city_state_input}%"))
+                # Query the database, converting location_address the same way
+                location_address = func.replace(func.replace(func.lower(FarmersMarket.location_address), ',', ''), '-', ' ')
+                query = query.filter(location_address.like(f"%{city_state_input}%"))
 
             if 'diversity' in filters:
                 diversity_column = f"{filters['diversity']}"
@@ -174,17 +253,19 @@ class FarmersMarketHandler:
 
         # Add diversity part
         if 'diversity' in filters:
-            diversity_part = self.get_mapping_slug_part(filters['diversity'], self.diverse_groups)
-            if diversity_part:
-                slug_parts.extend(diversity_part)
+            if filters['diversity'] in self.filter_slugs:
+                slug_parts.append(self.filter_slugs[filters['diversity']])
                 slug_parts.append('Farmers-Markets-That')
         else:
             slug_parts.append('Farmers-Markets-That')  
 
         # Add production, payments, and fnap parts
-        slug_parts.extend(self.get_mapping_slug_part(filters.get('production'), self.production_methods, 'have', 'products'))
-        slug_parts.extend(self.get_mapping_slug_part(filters.get('payments'), self.accepted_payments, 'accept'))
-        slug_parts.extend(self.get_mapping_slug_part(filters.get('fnap'), self.fnap_methods, 'accept'))
+        if filters.get('production') in self.filter_slugs:
+            slug_parts.extend(['have', self.filter_slugs[filters['production']], 'products'])
+        if filters.get('payments') in self.filter_slugs:
+            slug_parts.extend(['accept', self.filter_slugs[filters['payments']]])
+        if filters.get('fnap') in self.filter_slugs:
+            slug_parts.extend(['accept', self.filter_slugs[filters['fnap']]])
 
         # Add city_state part
         if 'city_state' in filters:
@@ -193,13 +274,23 @@ class FarmersMarketHandler:
         slug = '-'.join(slug_parts).lower()
         return slug
 
-    def get_mapping_slug_part(self, key, mapping, *additional_parts):
-        if key in mapping:
-            part = mapping[key].replace(' ', '-').replace(',', '')
-            return [*additional_parts, part]
-        return []
+    def slug_alternatives(self, mapping):
+        # Longest first so a value is never cut short by one that prefixes it
+        return '|'.join(re.escape(slug) for slug in sorted(mapping, key=len, reverse=True))
     
     def parse_slug_to_filters(self, slug_input):
+        match = self.slug_pattern.fullmatch(slug_input)
+        if match:
+            filters = {}
+            for name, mapping in [('diversity', self.diversity_mapping), ('production', self.production_mapping),
+                                  ('payments', self.payment_mapping), ('fnap', self.fnap_mapping)]:
+                if match.group(name):
+                    filters[name] = mapping[match.group(name)]
+            if match.group('city_state'):
+                filters['city_state'] = match.group('city_state').replace('-', ' ')
+            return filters
+
+        # Fall back to picking out known values for slugs not built by generate_slug_from_filters
         filters = {}
 
         # Define key phrases to split slug parts
@@ -219,61 +310,16 @@ class FarmersMarketHandler:
                     new_slug_parts.append(part)
             slug_parts = new_slug_parts
 
-        # Define mappings for each filter type
-        diversity_mapping = {
-            'native-american-owned-business': 'diversegroup_1',
-            'minority-owned-business': 'diversegroup_2',
-            'women-owned-business': 'diversegroup_3',
-            'veteran-owned-business': 'diversegroup_4',
-            'lgbtqia+-owned-business': 'diversegroup_5',
-            'disability-owned-business': 'diversegroup_6'
-        }
-
-        production_mapping = {
-            'organic-usda-certified': 'specialproductionmethods_1',
-            'non-certified-but-practicing-organic': 'specialproductionmethods_2',
-            'naturally-grown': 'specialproductionmethods_3',
-            'gap-certified': 'specialproductionmethods_4',
-            'no-antibiotics': 'specialproductionmethods_5',
-            'non-gmo': 'specialproductionmethods_6',
-            'no-hormones': 'specialproductionmethods_7',
-            'no-pesticides': 'specialproductionmethods_8',
-            'grass-fed': 'specialproductionmethods_9',
-            'pasture-raised-free-range-animals': 'specialproductionmethods_10',
-            'humane-treatment-of-animals': 'specialproductionmethods_11',
-            'fair-labor-practices-living-wage-fair-trade': 'specialproductionmethods_12',
-            'kosher': 'specialproductionmethods_13',
-            'halal': 'specialproductionmethods_14'
-        }
-
-        payment_mapping = {
-            'barter': 'acceptedpayment_1',
-            'volunteer-work': 'acceptedpayment_2',
-            'cash': 'acceptedpayment_3',
-            'personal-checks': 'acceptedpayment_4',
-            'commercial-checks-accounts': 'acceptedpayment_5',
-            'debit-card-credit-card': 'acceptedpayment_6',
-        }
-
-        fnap_mapping = {
-            'wic': 'FNAP_1',
-            'snap': 'FNAP_2',
-            'market-bucks': 'FNAP_3',
-            'wic-farmers-market': 'FNAP_4',
-            'senior-farmers-market-nutrition-program': 'FNAP_5',
-            'other-food-nutrition-assistance-programs': 'FNAP_888'
-        }
-
         # Iterate through each part of the slug and map it to filter parameters
         for part in slug_parts:
-            if part in diversity_mapping:
-                filters['diversity'] = diversity_mapping[part]
-            elif part in production_mapping:
-                filters['production'] = production_mapping[part]
-            elif part in payment_mapping:
-                filters['payments'] = payment_mapping[part]
-            elif part in fnap_mapping:
-                filters['fnap'] = fnap_mapping[part]
+            if part in self.diversity_mapping:
+                filters['diversity'] = self.diversity_mapping[part]
+            elif part in self.production_mapping:
+                filters['production'] = self.production_mapping[part]
+            elif part in self.payment_mapping:
+                filters['payments'] = self.payment_mapping[part]
+            elif part in self.fnap_mapping:
+                filters['fnap'] = self.fnap_mapping[part]
             elif part.strip():  # Check if part is not empty after removing leading/trailing spaces
                 # Assume it's the city-state part
                 filters['city_state'] = part.replace('-', ' ')  # Replace '-' with ' '
@@ -316,6 +362,10 @@ class FarmersMarketHandler:
         # Convert radius from miles to kilometers
         radius_in_km = radius_in_miles * 1.60934
 
+        snapshot = self.current_snapshot()
+        if snapshot is not None:
+            return self.find_markets_from_snapshot(snapshot, location_x, location_y, radius_in_km)
+
         # Query the database to retrieve all farmers markets
         session = Session()
         try:
@@ -350,3 +400,17 @@ class FarmersMarketHandler:
         } for market in markets_within_radius]
 
         return results
+
+    def find_markets_from_snapshot(self, snapshot, location_x, location_y, radius_in_km):
+        results = []
+        for i in range(len(snapshot)):
+            distance = self.calculate_distance(location_x, location_y, snapshot.location_x[i], snapshot.location_y[i])
+            if distance <= radius_in_km:
+                results.append({
+                    'listing_id': snapshot.listing_ids[i],
+                    'listing_name': snapshot.listing_names[i],
+                    'location_address': snapshot.location_addresses[i],
+                    'location_x': snapshot.location_x[i],
+                    'location_y': snapshot.location_y[i]
+                })
+        return results
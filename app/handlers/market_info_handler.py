@@ -1,6 +1,7 @@
 from models.models import FarmersMarket
 from app.db_control import Session
 from sqlalchemy import func
+import random
 
 class MarketInfoHandler:
     def __init__(self, market_handler):
@@ -172,7 +173,18 @@ class MarketInfoHandler:
         # Implement method to fetch random markets
         session = Session()
         try:
-            random_markets = session.query(FarmersMarket).order_by(func.random()).limit(3).all()
+            snapshot = self.market_handler.current_snapshot()
+            if snapshot is not None and len(snapshot.all_listing_ids) >= 3:
+                # Pick ids from the shared list instead of sorting the whole table
+                listing_ids = random.sample(snapshot.all_listing_ids, 3)
+                random_markets = session.query(FarmersMarket).filter(FarmersMarket.listing_id.in_(listing_ids)).all()
+                if len(random_markets) < 3:
+                    # Some of the sampled markets were deleted since the snapshot was built
+                    found_ids = [market.listing_id for market in random_markets]
+                    random_markets += session.query(FarmersMarket).filter(~FarmersMarket.listing_id.in_(found_ids)) \
+                        .order_by(func.random()).limit(3 - len(random_markets)).all()
+            else:
+                random_markets = session.query(FarmersMarket).order_by(func.random()).limit(3).all()
             random_market_data = [{'listing_id': market.listing_id, 'listing_name': market.listing_name} for market in random_markets]
             return random_market_data
         except Exception as e:
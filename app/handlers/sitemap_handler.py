@@ -0,0 +1,186 @@
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import product
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+from sqlalchemy import func
+from models.models import FarmersMarket
+from app.db_control import Session
+import json
+import math
+import os
+import zlib
+
+MAX_URLS_PER_SHARD = 50000  # Limit set by the sitemap protocol
+SHARD_FILL = 0.8  # Leave room so shards don't overflow as markets are added
+MANIFEST_NAME = 'manifest.json'
+INDEX_NAME = 'sitemap.xml'
+
+class SitemapHandler:
+    def __init__(self, market_handler):
+        self.market_handler = market_handler
+
+    def count_filter_combinations(self):
+        """Count markets for every diversity x production x payments x fnap x city combination.
+
+        Reads the table once and expands each market into every combination it
+        matches, with None standing for "filter not set". Only combinations with
+        at least one market end up in the result.
+        """
+        dimensions = [
+            ('diversity', list(self.market_handler.diverse_groups)),
+            ('production', list(self.market_handler.production_methods)),
+            ('payments', list(self.market_handler.accepted_payments)),
+            ('fnap', list(self.market_handler.fnap_methods)),
+        ]
+        columns = [getattr(FarmersMarket, key) for _, keys in dimensions for key in keys]
+
+        counts = Counter()
+        session = Session()
+        try:
+            rows = session.query(func.lower(FarmersMarket.location_address), *columns).yield_per(1000)
+            for row in rows:
+                flags = iter(row[1:])
+                options = []
+                for _, keys in dimensions:
+                    options.append([None] + [key for key in keys if next(flags) == 1])
+                # The city values match the ones get_filters offers
+                options.append([None, row[0]] if row[0] else [None])
+
+                for combination in product(*options):
+                    counts[combination] += 1
+        finally:
+            session.close()
+
+        filter_names = [name for name, _ in dimensions] + ['city_state']
+        slug_counts = Counter()
+        dropped = []
+        for combination, count in counts.items():
+            filters = {name: value for name, value in zip(filter_names, combination) if value is not None}
+            slug = self.market_handler.generate_slug_from_filters(filters)
+            if self.round_trips(slug, filters):
+                slug_counts[slug] += count
+            else:
+                dropped.append(slug)
+
+        if dropped:
+            print(f"Skipped {len(dropped)} sitemap slugs that don't parse back to their filters, e.g. {dropped[:5]}")
+        return slug_counts
+
+    def round_trips(self, slug, filters):
+        # Safety net: a page only shows these markets if its slug parses back to
+        # the same filters. Cities are compared the way get_markets_by_filters
+        # matches them, without commas and with hyphens as spaces.
+        parsed = self.market_handler.parse_slug_to_filters(slug)
+        expected = dict(filters)
+        if 'city_state' in expected and 'city_state' in parsed:
+            expected['city_state'] = self.normalize_city(expected['city_state'])
+            parsed['city_state'] = self.normalize_city(parsed['city_state'])
+        return parsed == expected
+
+    def normalize_city(self, city_state):
+        return city_state.replace(',', '').replace('-', ' ').lower()
+
+    def generate_sitemap(self, base_url, output_dir):
+        """Write sitemap shards, a sitemap index and a slug -> count manifest.
+
+        Slugs are assigned to shards by hash, so on a later run with the same
+        base_url only the shards whose slug set changed are rewritten. Returns the indexes of the shards
+        that were written.
+        """
+        base_url = base_url.rstrip('/')
+        os.makedirs(output_dir, exist_ok=True)
+
+        counts = self.count_filter_combinations()
+        previous = self.load_manifest(output_dir)
+
+        shard_count = previous.get('shard_count', 0)
+        shards = self.assign_shards(counts, shard_count) if shard_count else None
+        if shards is None or max(len(slugs) for slugs in shards) > MAX_URLS_PER_SHARD \
+                or previous.get('base_url') != base_url:
+            # First run, a shard outgrew the limit or the URLs moved: reshard and rewrite everything
+            shard_count = max(1, math.ceil(len(counts) / (MAX_URLS_PER_SHARD * SHARD_FILL)))
+            shards = self.assign_shards(counts, shard_count)
+            previous = {}
+
+        old_shards = self.assign_shards(previous.get('counts', {}), shard_count)
+        old_lastmod = previous.get('lastmod', {})
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        lastmod = {}
+        written = []
+        for index, slugs in enumerate(shards):
+            filename = self.shard_filename(index)
+            path = os.path.join(output_dir, filename)
+            if slugs == old_shards[index] and filename in old_lastmod and os.path.exists(path):
+                lastmod[filename] = old_lastmod[filename]
+                continue
+            self.write_shard(path, base_url, slugs)
+            lastmod[filename] = now
+            written.append(index)
+
+        # Remove shards left over from a run with more shards
+        for name in os.listdir(output_dir):
+            if name.startswith('sitemap-') and name.endswith('.xml') and name not in lastmod:
+                os.remove(os.path.join(output_dir, name))
+
+        self.write_index(os.path.join(output_dir, INDEX_NAME), base_url, lastmod)
+        self.write_atomic(os.path.join(output_dir, MANIFEST_NAME), json.dumps({
+            'base_url': base_url,
+            'shard_count': shard_count,
+            'lastmod': lastmod,
+            'counts': dict(sorted(counts.items()))
+        }, indent=2))
+        return written
+
+    def assign_shards(self, counts, shard_count):
+        shards = [[] for _ in range(shard_count)]
+        for slug in sorted(counts):
+            shards[zlib.crc32(slug.encode()) % shard_count].append(slug)
+        return shards
+
+    def shard_filename(self, index):
+        return f"sitemap-{index:05d}.xml"
+
+    def load_manifest(self, output_dir):
+        try:
+            with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def write_shard(self, path, base_url, slugs):
+        with open_atomic(path) as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+            for slug in slugs:
+                # Escape '/' too, so every slug stays a single path segment
+                loc = f"{base_url}/{quote(slug, safe='')}"
+                f.write(f"  <url><loc>{escape(loc)}</loc></url>\n")
+            f.write('</urlset>\n')
+
+    def write_index(self, path, base_url, lastmod):
+        with open_atomic(path) as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+            for filename, modified in lastmod.items():
+                f.write(f"  <sitemap><loc>{escape(f'{base_url}/{filename}')}</loc><lastmod>{modified}</lastmod></sitemap>\n")
+            f.write('</sitemapindex>\n')
+
+    def write_atomic(self, path, content):
+        with open_atomic(path) as f:
+            f.write(content)
+
+
+@contextmanager
+def open_atomic(path):
+    # Write to a temporary file and move it into place on success, so
+    # crawlers never see a half-written sitemap
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            yield f
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
@@ -0,0 +1,111 @@
+from array import array
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from models.models import FarmersMarket
+from app.db_control import Session
+import os
+import time
+
+# Seconds between checks of the table for changes
+MAX_AGE = float(os.environ.get('SNAPSHOT_MAX_AGE', 60))
+
+class MarketSnapshot:
+    """Read-only copy of the market data the hot endpoints need.
+
+    Built once in the pre-fork master (see wsgi.py) so every worker shares the
+    same pages. Ids and coordinates live in flat arrays, which the GC does not
+    track, so touching them in a worker never dirties the shared memory.
+
+    The table's row count and latest update_time are used as a version. Once
+    MAX_AGE has passed, refreshed() compares that version with the table's and
+    rebuilds the snapshot if it changed. A rebuilt snapshot is private to the
+    worker that built it.
+    """
+
+    def __init__(self, version, all_listing_ids, listing_ids, location_x, location_y, listing_names, location_addresses, city_states):
+        self.version = version
+        self.checked_at = time.monotonic()
+        self.all_listing_ids = all_listing_ids  # Every market, with or without coordinates
+        # Markets with coordinates, in parallel arrays for the radius search
+        self.listing_ids = listing_ids
+        self.location_x = location_x
+        self.location_y = location_y
+        self.listing_names = listing_names
+        self.location_addresses = location_addresses
+        self.city_states = city_states
+
+    def __len__(self):
+        return len(self.listing_ids)
+
+    @staticmethod
+    def query_version(session):
+        return tuple(session.query(func.count(FarmersMarket.listing_id), func.max(FarmersMarket.update_time)).one())
+
+    @classmethod
+    def load(cls):
+        all_listing_ids = array('q')
+        listing_ids = array('q')
+        location_x = array('d')
+        location_y = array('d')
+        listing_names = []
+        location_addresses = []
+        city_states = {}
+
+        session = Session()
+        try:
+            # Read the version first, so a change made during the load triggers another one
+            version = cls.query_version(session)
+            # Only the columns used here, rather than hydrating every column of every row
+            markets = session.query(FarmersMarket.listing_id, FarmersMarket.listing_name, FarmersMarket.location_address,
+                                    FarmersMarket._location_x, FarmersMarket._location_y)
+            for market in markets:
+                all_listing_ids.append(market.listing_id)
+                # Same values get_unique_city_states returns
+                city_states[market.location_address.lower() if market.location_address is not None else None] = None
+
+                # Markets without usable coordinates can never match a radius search
+                x = cls.to_float(market._location_x)
+                y = cls.to_float(market._location_y)
+                if x is None or y is None:
+                    continue
+                listing_ids.append(market.listing_id)
+                location_x.append(x)
+                location_y.append(y)
+                listing_names.append(market.listing_name)
+                location_addresses.append(market.location_address)
+        finally:
+            session.close()
+
+        return cls(version, all_listing_ids, listing_ids, location_x, location_y,
+                   tuple(listing_names), tuple(location_addresses), tuple(city_states))
+
+    @staticmethod
+    def to_float(value):
+        # Same conversion as FarmersMarket.location_x, but None for blank or malformed values
+        if isinstance(value, str):
+            try:
+                return float(value.replace(',', ''))
+            except ValueError:
+                return None
+        return value
+
+    def refreshed(self, max_age=MAX_AGE):
+        """Return this snapshot, or a rebuilt one if the table changed since it was loaded."""
+        now = time.monotonic()
+        if now - self.checked_at < max_age:
+            return self
+
+        self.checked_at = now
+        try:
+            session = Session()
+            try:
+                version = self.query_version(session)
+            finally:
+                session.close()
+            if version == self.version:
+                return self
+            return self.load()
+        except SQLAlchemyError as e:
+            # Keep serving the data we have and try again after max_age
+            print(f"Error refreshing market snapshot: {e}")
+            return self
@@ -0,0 +1,174 @@
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from flask import g, request
+
+class StackSampler:
+    """Samples the call stack of one thread from a background thread.
+
+    Stacks are kept as collapsed lines ("outer;inner;leaf count"), the format
+    flamegraph.pl, speedscope and inferno read directly.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class RequestProfiler:
+    """Profiles a sample of requests, or any request carrying the trusted token.
+
+    sample_rate and threshold_ms can be changed while the server runs by writing
+    {"sample_rate": 0.05, "threshold_ms": 300} to control_file. Every worker
+    re-reads it at most once per control_interval seconds. Removing the file
+    restores the values the profiler was created with.
+    """
+
+    def __init__(self, sample_rate=0.0, token=None, threshold_ms=500, output_dir='profiles', max_files=200, interval=0.005,
+                 control_file=None, control_interval=5):
+        self.sample_rate = sample_rate  # Fraction of requests to profile, 0 disables sampling
+        self.token = token  # Requests sending this value in the header are always profiled
+        self.threshold_ms = threshold_ms
+        self.output_dir = output_dir
+        self.max_files = max_files
+        self.interval = interval
+        self.control_file = control_file
+        self.control_interval = control_interval
+        self.defaults = {'sample_rate': sample_rate, 'threshold_ms': threshold_ms}
+        self.control_checked_at = None
+        self.control_version = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+            token=os.environ.get('PROFILE_TOKEN') or None,
+            threshold_ms=float(os.environ.get('PROFILE_THRESHOLD_MS', 500)),
+            output_dir=os.environ.get('PROFILE_DIR', 'profiles'),
+            max_files=int(os.environ.get('PROFILE_MAX_FILES', 200)),
+            interval=float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000,
+            control_file=os.environ.get('PROFILE_CONTROL_FILE') or None,
+            control_interval=float(os.environ.get('PROFILE_CONTROL_INTERVAL', 5))
+        )
+
+    def init_app(self, app):
+        app.before_request(self.start_profile)
+        app.teardown_request(self.stop_profile)
+
+    def reload_control(self):
+        if not self.control_file:
+            return
+        now = time.monotonic()
+        if self.control_checked_at is not None and now - self.control_checked_at < self.control_interval:
+            return
+        self.control_checked_at = now
+
+        try:
+            stat = os.stat(self.control_file)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            version = None
+        if version == self.control_version:
+            return
+
+        control = {}
+        if version is not None:
+            try:
+                with open(self.control_file) as f:
+                    control = json.load(f)
+                sample_rate = float(control.get('sample_rate', self.defaults['sample_rate']))
+                threshold_ms = float(control.get('threshold_ms', self.defaults['threshold_ms']))
+            except (OSError, ValueError, TypeError, AttributeError) as e:
+                print(f"Error reading profiler control file: {e}")
+                return
+        else:
+            sample_rate = self.defaults['sample_rate']
+            threshold_ms = self.defaults['threshold_ms']
+
+        self.control_version = version
+        self.sample_rate = sample_rate
+        self.threshold_ms = threshold_ms
+
+    def is_trusted(self):
+        header = request.headers.get('X-Profile-Token')
+        if not self.token or not header:
+            return False
+        # compare_digest rejects non-ASCII str, and WSGI header values are latin-1
+        return hmac.compare_digest(header.encode('latin-1', 'replace'), self.token.encode())
+
+    def start_profile(self):
+        self.reload_control()
+        forced = self.is_trusted()
+        if not forced and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return
+
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        g.profile_sampler = sampler
+        g.profile_forced = forced
+        g.profile_started = time.perf_counter()
+        sampler.start()
+
+    def stop_profile(self, exc=None):
+        sampler = g.pop('profile_sampler', None)
+        if sampler is None:
+            return
+        sampler.stop()
+
+        elapsed_ms = (time.perf_counter() - g.pop('profile_started')) * 1000
+        forced = g.pop('profile_forced')
+        # Requests shorter than one sampling interval have nothing worth keeping
+        if not sampler.stacks:
+            return
+        # Sampled requests are only kept when slow; explicitly requested ones always are
+        if forced or elapsed_ms >= self.threshold_ms:
+            try:
+                self.write_profile(sampler, elapsed_ms)
+            except OSError as e:
+                print(f"Error writing profile: {e}")
+
+    def write_profile(self, sampler, elapsed_ms):
+        os.makedirs(self.output_dir, exist_ok=True)
+        endpoint = request.endpoint or 'unknown'
+        filename = f"{time.time_ns()}-{os.getpid()}-{endpoint}-{int(elapsed_ms)}ms.collapsed"
+        with open(os.path.join(self.output_dir, filename), 'w') as f:
+            f.write(sampler.collapsed())
+        self.rotate()
+
+    def rotate(self):
+        # File names start with a timestamp, so sorting them puts the oldest first
+        profiles = sorted(name for name in os.listdir(self.output_dir) if name.endswith('.collapsed'))
+        for name in profiles[:max(len(profiles) - self.max_files, 0)]:
+            try:
+                os.remove(os.path.join(self.output_dir, name))
+            except FileNotFoundError:
+                pass  # Another worker rotated it first
@@ -0,0 +1,12 @@
+import multiprocessing
+
+bind = '0.0.0.0:8000'
+workers = multiprocessing.cpu_count() * 2 + 1
+preload_app = True
+
+def post_fork(server, worker):
+    from app.db_control import engine
+
+    # The pool object came from the master; start a fresh one in this worker
+    # without closing the parent's connections
+    engine.dispose(close=False)
@@ -1,10 +1,17 @@
+import click
 from flask import Flask, jsonify, request
 from app.handlers.farmers_markets_handler import FarmersMarketHandler
 from app.handlers.market_info_handler import MarketInfoHandler
+from app.handlers.sitemap_handler import SitemapHandler
+from app.request_profiler import RequestProfiler
 
 app = Flask(__name__)
 market_handler = FarmersMarketHandler()
 market_info_handler = MarketInfoHandler(market_handler)
+sitemap_handler = SitemapHandler(market_handler)
+
+# Off unless PROFILE_SAMPLE_RATE, PROFILE_TOKEN or the PROFILE_CONTROL_FILE contents turn it on
+RequestProfiler.from_env().init_app(app)
 
 @app.route('/api/get_filters', methods=['GET'])
 def get_filters():
@@ -34,5 +41,12 @@ def query_results():
     results = market_handler.query_results(data)
     return jsonify(results)
 
+@app.cli.command('generate-sitemap')
+@click.option('--base-url', required=True, help='Public URL the SEO pages and sitemap files are served from.')
+@click.option('--output-dir', default='sitemap', help='Directory for the sitemap shards, index and manifest.')
+def generate_sitemap(base_url, output_dir):
+    written = sitemap_handler.generate_sitemap(base_url, output_dir)
+    click.echo(f"Wrote {len(written)} sitemap shard(s) to {output_dir}")
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,100 @@
+import sys
+import unittest
+from datetime import datetime
+from unittest import mock
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# app.db_control connects to MySQL on import; the tests bind Session to SQLite instead
+with mock.patch.dict(sys.modules, {'app.db_control': mock.MagicMock()}):
+    from models.models import Base, FarmersMarket
+    import app.market_snapshot as market_snapshot
+    import app.handlers.farmers_markets_handler as farmers_markets_handler
+    import app.handlers.market_info_handler as market_info_handler
+
+
+class MarketSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine('sqlite://', poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        self.Session = sessionmaker(bind=engine)
+        for module in (market_snapshot, farmers_markets_handler, market_info_handler):
+            patcher = mock.patch.object(module, 'Session', self.Session)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        session = self.Session()
+        coordinates = [('40.70', '-74.00'), ('40.75', '-73.98'), ('41.50', '-72.00'), ('1,040.0', '-74.0'), (None, None), ('', '-74.0')]
+        for listing_id, (x, y) in enumerate(coordinates, start=1):
+            session.add(FarmersMarket(listing_id=listing_id, listing_name=f"Market {listing_id}",
+                                      location_address=f"Town {listing_id}, NY", _location_x=x, _location_y=y,
+                                      update_time=datetime(2024, 1, 1)))
+        session.commit()
+        session.close()
+
+        self.app = Flask(__name__)
+        self.handler = farmers_markets_handler.FarmersMarketHandler()
+        self.info_handler = market_info_handler.MarketInfoHandler(self.handler)
+
+    def find_markets(self):
+        with self.app.test_request_context(query_string={'location_x': '40.71', 'location_y': '-74.01', 'radius': '60'}):
+            return self.handler.find_markets_from_radius({})
+
+    def test_load_skips_markets_without_usable_coordinates(self):
+        snapshot = market_snapshot.MarketSnapshot.load()
+        self.assertEqual(list(snapshot.all_listing_ids), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(list(snapshot.listing_ids), [1, 2, 3, 4])
+        self.assertEqual(snapshot.location_x[3], 1040.0)
+
+    def test_snapshot_radius_search_matches_database(self):
+        session = self.Session()
+        session.query(FarmersMarket).filter_by(listing_id=6).delete()  # The database path can't read blank coordinates
+        session.commit()
+        session.close()
+
+        from_database = self.find_markets()
+        self.handler.snapshot = market_snapshot.MarketSnapshot.load()
+        from_snapshot = self.find_markets()
+        self.assertEqual(from_snapshot, from_database)
+        self.assertEqual([market['listing_id'] for market in from_snapshot], [1, 2])
+
+    def test_random_markets_top_up_deleted_ids(self):
+        self.handler.snapshot = market_snapshot.MarketSnapshot.load()
+        session = self.Session()
+        session.query(FarmersMarket).filter(FarmersMarket.listing_id.in_([1, 2])).delete()
+        session.commit()
+        session.close()
+
+        with mock.patch.object(market_info_handler.random, 'sample', return_value=[1, 2, 5]):
+            random_markets = self.info_handler.get_random_markets()
+        listing_ids = [market['listing_id'] for market in random_markets]
+        self.assertEqual(len(listing_ids), 3)
+        self.assertIn(5, listing_ids)  # Sampled market without coordinates is kept
+        self.assertFalse({1, 2} & set(listing_ids))
+
+    def test_refresh_rebuilds_after_change(self):
+        snapshot = market_snapshot.MarketSnapshot.load()
+        session = self.Session()
+        session.query(FarmersMarket).filter_by(listing_id=1).delete()
+        session.commit()
+        session.close()
+
+        self.assertIs(snapshot.refreshed(max_age=60), snapshot)
+        refreshed = snapshot.refreshed(max_age=0)
+        self.assertIsNot(refreshed, snapshot)
+        self.assertNotIn(1, refreshed.all_listing_ids)
+
+    def test_refresh_keeps_snapshot_when_database_fails(self):
+        snapshot = market_snapshot.MarketSnapshot.load()
+        error = OperationalError('SELECT', {}, Exception('database is down'))
+        with mock.patch.object(market_snapshot.MarketSnapshot, 'query_version', side_effect=error):
+            self.assertIs(snapshot.refreshed(max_age=0), snapshot)
+        # The failed check counts, so the next request doesn't hit the database again
+        self.assertIs(snapshot.refreshed(max_age=60), snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from flask import Flask
+from app.request_profiler import RequestProfiler
+
+
+class RequestProfilerTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output_dir = os.path.join(tmp.name, 'profiles')
+        self.control_file = os.path.join(tmp.name, 'control.json')
+
+    def make_app(self, profiler):
+        app = Flask(__name__)
+        profiler.init_app(app)
+
+        @app.route('/fast')
+        def fast():
+            return 'ok'
+
+        @app.route('/slow')
+        def slow():
+            time.sleep(0.05)
+            return 'ok'
+
+        return app.test_client()
+
+    def profiles(self):
+        return sorted(os.listdir(self.output_dir)) if os.path.isdir(self.output_dir) else []
+
+    def test_non_ascii_token_header_is_not_trusted(self):
+        profiler = RequestProfiler(token='secret')
+        app = Flask(__name__)
+        with app.test_request_context(headers={'X-Profile-Token': '\xff\xe9'}):
+            self.assertFalse(profiler.is_trusted())
+        with app.test_request_context(headers={'X-Profile-Token': 'secret'}):
+            self.assertTrue(profiler.is_trusted())
+
+    def test_sampled_requests_under_threshold_are_skipped(self):
+        client = self.make_app(RequestProfiler(sample_rate=1, threshold_ms=10000, output_dir=self.output_dir, interval=0.001))
+        self.assertEqual(client.get('/slow').status_code, 200)
+        self.assertEqual(self.profiles(), [])
+
+    def test_sampled_requests_over_threshold_are_written(self):
+        client = self.make_app(RequestProfiler(sample_rate=1, threshold_ms=10, output_dir=self.output_dir, interval=0.001))
+        client.get('/slow')
+        profiles = self.profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertIn('-slow-', profiles[0])
+        with open(os.path.join(self.output_dir, profiles[0])) as f:
+            self.assertIn('slow (test_request_profiler.py:', f.read())
+
+    def test_forced_request_without_samples_writes_nothing(self):
+        client = self.make_app(RequestProfiler(token='secret', output_dir=self.output_dir, interval=10))
+        client.get('/fast', headers={'X-Profile-Token': 'secret'})
+        client.get('/missing', headers={'X-Profile-Token': 'secret'})
+        self.assertEqual(self.profiles(), [])
+
+    def test_rotate_keeps_newest_files(self):
+        os.makedirs(self.output_dir)
+        names = [f"{1700000000000000000 + i}-1-slow-600ms.collapsed" for i in range(5)]
+        for name in names:
+            open(os.path.join(self.output_dir, name), 'w').close()
+
+        RequestProfiler(output_dir=self.output_dir, max_files=2).rotate()
+        self.assertEqual(self.profiles(), names[-2:])
+
+    def test_control_file_changes_settings_at_runtime(self):
+        profiler = RequestProfiler(threshold_ms=500, control_file=self.control_file, control_interval=0)
+        with open(self.control_file, 'w') as f:
+            json.dump({'sample_rate': 0.25, 'threshold_ms': 100}, f)
+        profiler.reload_control()
+        self.assertEqual((profiler.sample_rate, profiler.threshold_ms), (0.25, 100))
+
+        os.remove(self.control_file)
+        profiler.reload_control()
+        self.assertEqual((profiler.sample_rate, profiler.threshold_ms), (0.0, 500))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# app.db_control connects to MySQL on import; the tests bind Session to SQLite instead
+with mock.patch.dict(sys.modules, {'app.db_control': mock.MagicMock()}):
+    from models.models import Base, FarmersMarket
+    import app.handlers.farmers_markets_handler as farmers_markets_handler
+    import app.handlers.sitemap_handler as sitemap_handler
+
+
+class SitemapHandlerTest(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine('sqlite://', poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        for module in (farmers_markets_handler, sitemap_handler):
+            patcher = mock.patch.object(module, 'Session', Session)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        session = Session()
+        session.add(FarmersMarket(listing_id=1, location_address='Austin, TX', acceptedpayment_6=1, specialproductionmethods_10=1))
+        session.add(FarmersMarket(listing_id=2, location_address='Winston-Salem, NC', acceptedpayment_3=1))
+        session.commit()
+        session.close()
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output_dir = tmp.name
+        self.market_handler = farmers_markets_handler.FarmersMarketHandler()
+        self.handler = sitemap_handler.SitemapHandler(self.market_handler)
+
+    def manifest(self):
+        with open(os.path.join(self.output_dir, 'manifest.json')) as f:
+            return json.load(f)
+
+    def test_every_listed_slug_shows_its_markets(self):
+        self.handler.generate_sitemap('https://example.org', self.output_dir)
+        counts = self.manifest()['counts']
+        self.assertEqual(counts['farmers-markets-that-accept-cash-are-in-winston-salem-nc'], 1)
+        self.assertEqual(counts['farmers-markets'], 2)
+
+        for slug, count in counts.items():
+            with self.subTest(slug=slug):
+                filters = self.market_handler.parse_slug_to_filters(slug)
+                self.assertEqual(len(self.market_handler.get_markets_by_filters(filters)), count)
+
+    def test_base_url_change_rewrites_every_shard(self):
+        self.handler.generate_sitemap('https://old.org', self.output_dir)
+        self.assertEqual(self.handler.generate_sitemap('https://old.org', self.output_dir), [])
+
+        written = self.handler.generate_sitemap('https://new.org', self.output_dir)
+        self.assertEqual(written, list(range(self.manifest()['shard_count'])))
+        for name in os.listdir(self.output_dir):
+            if name.endswith('.xml'):
+                with open(os.path.join(self.output_dir, name)) as f:
+                    self.assertNotIn('old.org', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
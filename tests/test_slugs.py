@@ -0,0 +1,60 @@
+import sys
+import unittest
+from unittest import mock
+
+# app.db_control connects to MySQL on import; the slug code never touches it
+with mock.patch.dict(sys.modules, {'app.db_control': mock.MagicMock()}):
+    from app.handlers.farmers_markets_handler import FarmersMarketHandler
+    from app.handlers.sitemap_handler import SitemapHandler
+
+
+class SlugRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.handler = FarmersMarketHandler()
+        self.facets = {
+            'diversity': self.handler.diverse_groups,
+            'production': self.handler.production_methods,
+            'payments': self.handler.accepted_payments,
+            'fnap': self.handler.fnap_methods,
+        }
+
+    def test_every_facet_value_round_trips(self):
+        for name, mapping in self.facets.items():
+            for key in mapping:
+                filters = {name: key}
+                with self.subTest(filters=filters):
+                    slug = self.handler.generate_slug_from_filters(filters)
+                    self.assertNotIn('/', slug)
+                    self.assertEqual(self.handler.parse_slug_to_filters(slug), filters)
+
+    def test_combined_filters_round_trip(self):
+        for fnap in self.handler.fnap_methods:
+            filters = {
+                'diversity': 'diversegroup_5',
+                'production': 'specialproductionmethods_12',
+                'payments': 'acceptedpayment_6',
+                'fnap': fnap,
+                'city_state': 'portland or'
+            }
+            with self.subTest(fnap=fnap):
+                slug = self.handler.generate_slug_from_filters(filters)
+                self.assertEqual(self.handler.parse_slug_to_filters(slug), filters)
+
+    def test_city_drops_commas(self):
+        slug = self.handler.generate_slug_from_filters({'payments': 'acceptedpayment_3', 'city_state': 'austin, tx'})
+        self.assertEqual(slug, 'farmers-markets-that-accept-cash-are-in-austin-tx')
+        self.assertEqual(self.handler.parse_slug_to_filters(slug), {'payments': 'acceptedpayment_3', 'city_state': 'austin tx'})
+
+    def test_no_filters(self):
+        self.assertEqual(self.handler.generate_slug_from_filters({}), 'farmers-markets')
+        self.assertEqual(self.handler.parse_slug_to_filters('farmers-markets'), {})
+
+    def test_sitemap_round_trip_check(self):
+        sitemap_handler = SitemapHandler(self.handler)
+        self.assertTrue(sitemap_handler.round_trips('farmers-markets-that-are-in-austin-tx', {'city_state': 'austin, tx'}))
+        self.assertTrue(sitemap_handler.round_trips('farmers-markets-that-are-in-winston-salem-nc', {'city_state': 'winston-salem, nc'}))
+        self.assertFalse(sitemap_handler.round_trips('farmers-markets-that-accept-cash', {'city_state': 'austin, tx'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
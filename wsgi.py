@@ -0,0 +1,26 @@
+"""Production entry point for a pre-forking server, e.g. ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+gunicorn.conf.py sets ``preload_app`` so this module is imported once in the
+master. Everything built here is inherited by the workers through fork.
+
+The market snapshot is not rebuilt by a HUP reload, since the workers reuse the
+master's preloaded app. Instead each worker checks the table's row count and
+latest update_time every SNAPSHOT_MAX_AGE seconds (default 60) and rebuilds its
+own copy when they change. An edit that leaves update_time untouched is only
+picked up by a full restart.
+"""
+import gc
+from app.db_control import engine
+from app.market_snapshot import MarketSnapshot
+from main import app, market_handler
+
+# Build the shared read-only data once, in the master
+market_handler.snapshot = MarketSnapshot.load()
+
+# Drop the connections used above so no socket is shared across workers;
+# each worker opens its own pool after fork (see post_fork in gunicorn.conf.py)
+engine.dispose()
+
+# Move everything allocated so far into the permanent generation so worker
+# GC passes don't write to (and copy) the pages inherited from the master
+gc.freeze()